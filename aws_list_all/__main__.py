@@ -1,19 +1,21 @@
 #!/usr/bin/env python
 import json
 import os
+import stat
 from argparse import ArgumentParser
-from platform import python_version_tuple
-from sys import exit, stderr
+from collections import defaultdict
+from sys import exit, stderr, stdout, version_info
+from tempfile import NamedTemporaryFile
 
-from botocore.loaders import Loader
+# from gooey import Gooey
 
-from aws_list_all.client import get_client
-from introspection import (
-    get_listing_operations, get_services, get_verbs, introspect_regions_for_service, recreate_caches
-)
-from query import do_list_files, do_query, RESULT_NOTHING, RESULT_SOMETHING, RESULT_NO_ACCESS, RESULT_ERROR
+CAN_USE_ORJSON = False
+try:
+    import orjson
 
-# from gooey import Gooey
+    CAN_USE_ORJSON = True
+except ImportError:
+    pass
 
 CAN_SET_OPEN_FILE_LIMIT = False
 try:
@@ -23,8 +25,7 @@ try:
 except ImportError:
     pass
 
-python_major, python_minor, _ = python_version_tuple()
-if int(python_major) < 3 or (int(python_major) == 3 and int(python_minor) < 7):
+if version_info < (3, 7):
     print("WARNING: Unsupported python version. The program may crash now.")
 
 
@@ -58,29 +59,48 @@ def increase_limit_nofiles():
 
 # @Gooey
 def restructure(data):
+    """Group the result tuples of each result type by region and service"""
     new_data = {}
-    for data_type in data.keys():
-        new_data[data_type] = {}
-
-    for data_type in data.keys():
-        for item in data[data_type]:
-            region = item[0]
-            service = item[1]
-            operation = item[2]
-            result_types = item[3].split(", ")
-
-            if region not in new_data[data_type]:
-                new_data[data_type][region] = {}
-            if service not in new_data[data_type][region]:
-                new_data[data_type][region][service] = []
-
-            new_data[data_type][region][service].append({
-                "operation": operation,
-                "result_types": result_types
-            })
+    for data_type, rows in data.items():
+        by_region = defaultdict(lambda: defaultdict(list))
+        for _, service, region, operation, *details in rows:
+            if len(details) == 1:
+                # Successful queries end with their resource types, see query.save_listing
+                entry = {"operation": operation, "result_types": details[0].split(", ")}
+            else:
+                # Failed queries end with the profile and the error, see query.classify_exception
+                entry = {"operation": operation, "error": details[-1]}
+            by_region[region][service].append(entry)
+        new_data[data_type] = {region: dict(by_service) for region, by_service in by_region.items()}
     return new_data
 
 
+def write_results(filename, results):
+    """Write the results as JSON, replacing the file at once so that an interrupted run cannot leave it truncated"""
+    if CAN_USE_ORJSON:
+        data = orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        # Without indentation, the json module can use its C encoder
+        data = json.dumps(results, separators=(',', ':')).encode('utf-8')
+    if os.path.exists(filename):
+        mode = stat.S_IMODE(os.stat(filename).st_mode)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    with NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(filename)), delete=False) as f:
+        try:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            # NamedTemporaryFile is only readable by the owner, give it the mode a plain open() would have
+            os.chmod(f.name, mode)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, filename)
+
+
 def main():
     """Parse CLI arguments to either list services, operations, queries or existing json files"""
     parser = ArgumentParser(
@@ -186,31 +206,43 @@ def main():
 
     args = parser.parse_args()
 
+    # Importing boto3 is slow, so it is deferred until the arguments are parsed and --help has been handled
+    from introspection import (
+        get_enabled_regions, get_listing_operations, get_regions_for_services, get_services, get_verbs,
+        introspect_regions_for_service, recreate_caches
+    )
+    from query import do_list_files, do_query, RESULT_SOMETHING, RESULT_NO_ACCESS, RESULT_ERROR
+
     if args.command == 'query':
+        from client import set_max_pool_connections
+
         if args.directory:
-            try:
-                os.makedirs(args.directory)
-            except OSError as e:
-                pass
+            os.makedirs(args.directory, exist_ok=True)
             os.chdir(args.directory)
         increase_limit_nofiles()
+        # Size the connection pools so that parallel requests to one endpoint do not wait for a connection
+        set_max_pool_connections(max(args.parallel, 50))
         services = args.service or get_services()
+        if os.path.exists('../to_run.json'):
+            # do_query reads the queries from to_run.json, so the regions are not needed
+            regions_by_service = None
+        else:
+            regions_by_service = get_regions_for_services(services, args.region, get_enabled_regions(args.profile))
         results_by_type = do_query(
             services,
             args.region,
             args.operation,
             verbose=args.verbose or 0,
             parallel=args.parallel,
-            selected_profile=args.profile
+            selected_profile=args.profile,
+            regions_by_service=regions_by_service
         )
-        results_by_type = restructure(results_by_type)
-        with open('../aws_list_all.json', 'w') as f:
-            json.dump(results_by_type, f, indent=2)
+        write_results('../aws_list_all.json', restructure(results_by_type))
         print("Wrote results to aws_list_all.json")
         for result_type in (RESULT_SOMETHING, RESULT_NO_ACCESS, RESULT_ERROR):
-            result = sorted(results_by_type[result_type])
-            for result in result:
-                print(*result)
+            rows = sorted(results_by_type[result_type])
+            if rows:
+                stdout.write(''.join(' '.join(map(str, row)) + '\n' for row in rows))
     elif args.command == 'show':
         if args.listingfile:
             increase_limit_nofiles()
@@ -245,6 +277,4 @@ def main():
 
 
 if __name__ == '__main__':
-    client, session = get_client('ecs')
-    s = Loader().list_available_services('region-1')
     exit(main())
@@ -1,13 +1,83 @@
-import boto3
+import asyncio
+from collections import defaultdict
+from functools import lru_cache
+from importlib.util import find_spec
+from threading import Lock
 
-_CLIENTS = {}
+# aioboto3 pulls in aiohttp, which is slow to import, so it is only imported once an async client is needed
+CAN_USE_ASYNC_CLIENTS = find_spec('aioboto3') is not None
+
+_SESSIONS = {}
+_SESSIONS_LOCK = Lock()
+# One lock per (service, region, profile), so that different clients can be created concurrently
+_CLIENT_LOCKS = defaultdict(Lock)
+_CLIENT_LOCKS_LOCK = Lock()
+_ASYNC_SESSIONS = {}
+_ASYNC_CLIENTS = {}
+
+# Size of the HTTP connection pool of each client. botocore defaults to 10, which makes parallel
+# requests to the same endpoint wait for a free connection.
+_MAX_POOL_CONNECTIONS = 64
+_RETRIES = {'max_attempts': 10, 'mode': 'adaptive'}
+
+
+def set_max_pool_connections(pool):
+    """Set the connection pool size for clients created from now on"""
+    global _MAX_POOL_CONNECTIONS  # pylint:disable=global-statement
+    _MAX_POOL_CONNECTIONS = pool
 
 
 def get_client(service, region='us-east-1', profile='default'):
-    """Return (cached) boto3 clients for this service and this region"""
+    """Return (cached) boto3 clients for this service and this region, and the session they belong to"""
+    # lru_cache alone may still create a client twice if two threads miss at the same time
+    with _CLIENT_LOCKS_LOCK:
+        lock = _CLIENT_LOCKS[(service, region, profile)]
+    with lock:
+        return _create_client(service, region, profile)
+
+
+@lru_cache(maxsize=None)
+def _create_client(service, region, profile):
+    # boto3 is imported here, since importing it is slow and many commands do not need a client
+    import boto3
+    from botocore.config import Config
+
+    # One session per profile, so that configuration and endpoint data are loaded only once
+    with _SESSIONS_LOCK:
+        if profile not in _SESSIONS:
+            _SESSIONS[profile] = boto3.Session(profile_name=profile)
+        session = _SESSIONS[profile]
+    config = Config(max_pool_connections=_MAX_POOL_CONNECTIONS, retries=_RETRIES)
+    return session.client(service, region_name=region, config=config), session
+
+
+async def get_async_client(service, region='us-east-1', profile='default'):
+    """Return (cached) aioboto3 clients for this service and this region.
+
+    The client is entered once and kept open until close_async_clients() is called, so that all
+    requests in one event loop share its connection pool."""
     key = (service, region, profile)
-    session = None
-    if key not in _CLIENTS:
-        session = boto3.Session(region_name=region, profile_name=profile)
-        _CLIENTS[key] = session.client(service)
-    return _CLIENTS[key], session
+    if key not in _ASYNC_CLIENTS:
+        import aioboto3
+        from aiobotocore.config import AioConfig
+
+        if profile not in _ASYNC_SESSIONS:
+            _ASYNC_SESSIONS[profile] = aioboto3.Session(profile_name=profile)
+        session = _ASYNC_SESSIONS[profile]
+        config = AioConfig(max_pool_connections=_MAX_POOL_CONNECTIONS, retries=_RETRIES)
+        # Cache the pending creation, so that concurrent callers do not create duplicate clients
+        client_context = session.client(service, region_name=region, config=config)
+        _ASYNC_CLIENTS[key] = asyncio.ensure_future(client_context.__aenter__())
+    return await _ASYNC_CLIENTS[key]
+
+
+async def close_async_clients():
+    """Close all cached aioboto3 clients; they are bound to the event loop they were created in"""
+    pending = list(_ASYNC_CLIENTS.values())
+    _ASYNC_CLIENTS.clear()
+    for future in pending:
+        try:
+            client = await future
+        except Exception:  # pylint:disable=broad-except
+            continue
+        await client.__aexit__(None, None, None)
@@ -3,8 +3,10 @@ from collections import defaultdict
 from json import load, dump
 from multiprocessing.pool import ThreadPool
 from socket import gethostbyname, gaierror
+from sys import stderr
 
 import boto3
+from botocore.config import Config
 from pkg_resources import resource_stream, resource_filename
 
 from app_json_file_cache import AppCache
@@ -429,24 +431,29 @@ PARAMETERS_REQUIRED = {
 }
 
 
+@cache('available_services', vary={'boto3_version': boto3.__version__})
+def get_available_services():
+    """Return a sorted list of all service names that the current boto3 version has clients for"""
+    return sorted(boto3.Session().get_available_services())
+
+
 def get_services():
     """Return a list of all service names where listable resources can be present"""
-    return [
-        service for service in sorted(boto3.Session().get_available_services()) if service not in SERVICE_IGNORE_LIST
-    ]
+    return [service for service in get_available_services() if service not in SERVICE_IGNORE_LIST]
 
 
 def get_verbs(service):
     """Return a list of "Verbs" given a boto3 service client. A "Verb" in this context is
     the first CamelCased word in an API call"""
-    client = get_client(service)
+    client, _ = get_client(service)
     return set(re.sub('([A-Z])', '_\\1', x).split('_')[1] for x in client.meta.method_to_api_mapping.values())
 
 
-def get_listing_operations(service, region=None, selected_operations=(), profile=None):
-    """Return a list of API calls which (probably) list resources created by the user
-    in the given service (in contrast to AWS-managed or default resources)"""
-    client = get_client(service, region, profile)
+@cache('parameterless_operations', vary={'boto3_version': boto3.__version__})
+def get_parameterless_operations(service):
+    """Return a sorted list of API calls of the given service that look like listings and can be called
+    without parameters. This only depends on the boto3 service model, so it is cached on disk."""
+    client, _ = get_client(service, profile=None)
     operations = []
     for operation in sorted(client.meta.service_model.operation_names):
         if not any(operation.startswith(prefix) for prefix in VERBS_LISTINGS):
@@ -456,6 +463,17 @@ def get_listing_operations(service, region=None, selected_operations=(), profile
         required_members = [m for m in required_members if m != 'MaxResults']
         if required_members:
             continue
+        operations.append(operation)
+    return operations
+
+
+def get_listing_operations(service, region=None, selected_operations=(), profile=None):
+    """Return a list of API calls which (probably) list resources created by the user
+    in the given service (in contrast to AWS-managed or default resources).
+
+    The operations are the same in all regions and for all profiles."""
+    operations = []
+    for operation in get_parameterless_operations(service):
         if operation in PARAMETERS_REQUIRED.get(service, []):
             continue
         if operation in AWS_RESOURCE_QUERIES.get(service, []):
@@ -471,6 +489,8 @@ def get_listing_operations(service, region=None, selected_operations=(), profile
 
 
 def recreate_caches(update_packaged_values):
+    get_available_services.clear()
+    get_parameterless_operations.clear()
     get_endpoint_hosts.recalculate()
     get_service_regions.recalculate()
 
@@ -504,7 +524,7 @@ def get_endpoint_hosts():
         print('  ...looking for {} in all regions...'.format(service))
         result[service] = {}
         for region in ALL_REGIONS:
-            meta = get_client(service, region=region).meta
+            meta = get_client(service, region=region)[0].meta
             # In some services, different operations must access different host prefixes ("api.", "env.").
             # This means that the endpoint_url itself may not point to any host, defeating our heuristic.
             # Therefore, we only pick the base URL if at least one operation accesses it, otherwise we pick the
@@ -569,15 +589,44 @@ def get_service_regions():
     return {service: sorted(list(regions)) for service, regions in service_regions.items()}
 
 
-def get_regions_for_service(requested_service, requested_regions=()):
+def get_regions_for_service(requested_service, requested_regions=(), service_regions=None):
     """Given a service name, return a list of region names where this service can have resources,
     restricted by a possible set of regions."""
     if requested_service in ('iam', 'cloudfront', 's3', 'route53'):
         return [None]
-    regions = set(get_service_regions().get(requested_service, []))
+    if service_regions is None:
+        service_regions = get_service_regions()
+    regions = set(service_regions.get(requested_service, []))
     return list(regions) if not requested_regions else list(sorted(set(regions) & set(requested_regions)))
 
 
+def get_regions_for_services(requested_services, requested_regions=(), enabled_regions=None):
+    """Given service names, return a dict of service name to the list of region names where this service
+    can have resources, restricted by a possible set of regions and the regions enabled for the account."""
+    service_regions = get_service_regions()
+    result = {}
+    for service in requested_services:
+        regions = get_regions_for_service(service, requested_regions, service_regions)
+        if enabled_regions is not None:
+            regions = [region for region in regions if region is None or region in enabled_regions]
+        result[service] = regions
+    return result
+
+
+def get_enabled_regions(profile=None):
+    """Return the set of region names enabled for the account, or None if they cannot be determined.
+
+    Requests to regions that are not enabled (opt-in regions) fail for every service, so they can be skipped."""
+    # Not a cached client: this probe should give up quickly instead of retrying like the queries do
+    config = Config(connect_timeout=5, read_timeout=10, retries={'max_attempts': 2, 'mode': 'standard'})
+    try:
+        client = boto3.Session(profile_name=profile).client('ec2', region_name='us-east-1', config=config)
+        return set(region['RegionName'] for region in client.describe_regions()['Regions'])
+    except Exception as exc:  # pylint:disable=broad-except
+        print('Could not determine the enabled regions, querying all regions:', exc, file=stderr)
+        return None
+
+
 def introspect_regions_for_service():
     """Introspect and compare guessed and boto3-defined regions"""
     print('Comparing service/region pairs reported by boto3 and found via DNS queries')
@@ -1,11 +1,14 @@
 import pprint
+from functools import lru_cache
 
 import boto3
 
-from client import get_client
+from client import get_async_client, get_client
 
 
+@lru_cache(maxsize=None)
 def get_parameters():
+    """Return the parameters to call listing operations with, by service and operation name"""
     parameters = {
         'cloudfront': {
             'ListCachePolicies': {
@@ -69,17 +72,31 @@ def get_parameters():
     return parameters
 
 
-def run_raw_listing_operation(service, region, operation, profile):
-    """Execute a given operation and return its raw result"""
-    client = get_client(service, region, profile)
+def get_listing_call(client, service, operation):
+    """Return the client method name and the parameters to execute a given operation with"""
     api_to_method_mapping = dict((v, k) for k, v in client.meta.method_to_api_mapping.items())
-    parameters = get_parameters().get(service, {}).get(operation, {})
+    # Copy, since the parameters from get_parameters() are shared between calls
+    parameters = dict(get_parameters().get(service, {}).get(operation, {}))
     op_model = client.meta.service_model.operation_model(operation)
     required_members = op_model.input_shape.required_members if op_model.input_shape else []
     if "MaxResults" in required_members:
         # Current limit for cognito identity pools is 60
         parameters["MaxResults"] = 10
-    return getattr(client, api_to_method_mapping[operation])(**parameters)
+    return api_to_method_mapping[operation], parameters
+
+
+def run_raw_listing_operation(service, region, operation, profile):
+    """Execute a given operation and return its raw result"""
+    client, _ = get_client(service, region, profile)
+    method, parameters = get_listing_call(client, service, operation)
+    return getattr(client, method)(**parameters)
+
+
+async def run_raw_listing_operation_async(service, region, operation, profile):
+    """Execute a given operation with an aioboto3 client and return its raw result"""
+    client = await get_async_client(service, region, profile)
+    method, parameters = get_listing_call(client, service, operation)
+    return await getattr(client, method)(**parameters)
 
 
 class Listing(object):
@@ -140,6 +157,14 @@ class Listing(object):
             raise Exception('Bad AWS HTTP Status Code', response)
         return cls(service, region, operation, response, profile)
 
+    @classmethod
+    async def acquire_async(cls, service, region, operation, profile):
+        """Acquire the given listing by making an asynchronous AWS request"""
+        response = await run_raw_listing_operation_async(service, region, operation, profile)
+        if response['ResponseMetadata']['HTTPStatusCode'] != 200:
+            raise Exception('Bad AWS HTTP Status Code', response)
+        return cls(service, region, operation, response, profile)
+
     @property
     def resources(self):  # pylint:disable=too-many-branches
         """Transform the response data into a dict of resource names to resource listings"""
@@ -1,17 +1,30 @@
+import asyncio
 import json
 import sys
 import contextlib
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from functools import partial
+from multiprocessing import get_context
 from multiprocessing.pool import ThreadPool
+from os import cpu_count
 from os.path import exists
 from random import shuffle
 from time import time
 from traceback import print_exc
 
-from introspection import get_listing_operations, get_regions_for_service
-from listing import Listing
+from client import CAN_USE_ASYNC_CLIENTS, close_async_clients, get_async_client, get_client
+from introspection import get_listing_operations, get_regions_for_services
+from listing import Listing, get_parameters
+
+CAN_USE_ORJSON = False
+try:
+    import orjson
+
+    CAN_USE_ORJSON = True
+except ImportError:
+    pass
 
 RESULT_NOTHING = 'no_results'
 RESULT_SOMETHING = 'results'
@@ -285,6 +298,15 @@ RESULT_IGNORE_ERRORS = {
     },
 }
 
+# Post-processing smaller listings in the querying thread is cheaper than sending them to a worker process
+MIN_ITEMS_FOR_WORKER_PROCESS = 1000
+
+# Post-processing these listings issues follow-up requests, which should use the clients of the main process
+FOLLOW_UP_REQUEST_OPERATIONS = {
+    ('ec2', 'DescribeInternetGateways'),
+    ('kms', 'ListKeys'),
+}
+
 NOT_AVAILABLE_FOR_REGION_STRINGS = [
     'is not supported in this region',
     'is not available in this region',
@@ -308,17 +330,28 @@ NOT_AVAILABLE_FOR_ACCOUNT_STRINGS = [
 NOT_AVAILABLE_STRINGS = NOT_AVAILABLE_FOR_REGION_STRINGS + NOT_AVAILABLE_FOR_ACCOUNT_STRINGS
 
 
-def do_query(services, selected_regions=(), selected_operations=(), verbose=0, parallel=32, selected_profile=None):
+def do_query(
+    services,
+    selected_regions=(),
+    selected_operations=(),
+    verbose=0,
+    parallel=32,
+    selected_profile=None,
+    regions_by_service=None
+):
     """For the given services, execute all selected operations (default: all) in selected regions
-    (default: all)"""
+    (default: all). regions_by_service may map each service to the regions to query, as returned by
+    get_regions_for_services, if they are already known."""
     to_run = []
     print('Building set of queries to execute...')
     if exists('../to_run.json'):
         with open('../to_run.json') as f:
             to_run = json.load(f)
     else:
+        if regions_by_service is None:
+            regions_by_service = get_regions_for_services(services, selected_regions)
         for service in services:
-            for region in get_regions_for_service(service, selected_regions):
+            for region in regions_by_service[service]:
                 for operation in get_listing_operations(service, region, selected_operations, selected_profile):
                     if verbose > 0:
                         region_name = region or 'n/a'
@@ -328,67 +361,144 @@ def do_query(services, selected_regions=(), selected_operations=(), verbose=0, p
     shuffle(to_run)  # Distribute requests across endpoints
     results_by_type = defaultdict(list)
     print('...done. Executing queries...')
-    # the `with` block is a workaround for a bug: https://bugs.python.org/issue35629
-    with contextlib.closing(ThreadPool(parallel)) as pool:
-        for result in pool.imap_unordered(partial(acquire_listing, verbose), to_run):
-            if result[0] != RESULT_NOTHING:
-                results_by_type[result[0]].append(result)
-                if verbose > 1:
-                    print('ExecutedQueryResult: {}'.format(result))
-                else:
-                    print(result[0][-1], end='')
-                    sys.stdout.flush()
+    # Post-processing and serializing large listings is CPU-bound Python code, so it runs in worker processes
+    # to not compete for the GIL with the requests. Use spawn, since forking a threaded process is unsafe.
+    if (cpu_count() or 1) > 1:
+        executor = ProcessPoolExecutor(mp_context=get_context('spawn'))
+    else:
+        executor = ThreadPoolExecutor()
+    with executor:
+        if CAN_USE_ASYNC_CLIENTS:
+            # Building the request parameters creates a boto3 client, which must not block the event loop later
+            get_parameters()
+            asyncio.run(execute_queries_async(to_run, results_by_type, verbose, parallel, executor))
+        else:
+            # Create the clients up front, so that the threads do not build them concurrently on the shared session
+            for key in set((service, region, profile) for service, region, _, profile in to_run):
+                try:
+                    get_client(*key)
+                except Exception:  # pylint:disable=broad-except
+                    pass  # Reported by the queries that use the client
+            # the `with` block is a workaround for a bug: https://bugs.python.org/issue35629
+            with contextlib.closing(ThreadPool(parallel)) as pool:
+                for result in pool.imap_unordered(partial(acquire_listing, verbose, executor=executor), to_run):
+                    record_result(results_by_type, verbose, result)
     print('...done')
     return results_by_type
 
 
-def acquire_listing(verbose, what):
+async def execute_queries_async(to_run, results_by_type, verbose, parallel, executor=None):
+    """Execute all queries on one event loop, with at most `parallel` requests in flight"""
+    semaphore = asyncio.Semaphore(parallel)
+    try:
+        # Creating a client loads its service model synchronously, so do that before any request is in flight.
+        # Failures are reported by the queries that use the client.
+        clients = set((service, region, profile) for service, region, _, profile in to_run)
+        await asyncio.gather(*[get_async_client(*key) for key in clients], return_exceptions=True)
+        queries = [acquire_listing_async(semaphore, verbose, what, executor) for what in to_run]
+        for future in asyncio.as_completed(queries):
+            record_result(results_by_type, verbose, await future)
+    finally:
+        await close_async_clients()
+
+
+def record_result(results_by_type, verbose, result):
+    """Sort a query result into results_by_type and report progress"""
+    if result[0] != RESULT_NOTHING:
+        results_by_type[result[0]].append(result)
+        if verbose > 1:
+            print('ExecutedQueryResult: {}'.format(result))
+        else:
+            print(result[0][-1], end='')
+            sys.stdout.flush()
+
+
+def use_worker_process(listing):
+    """Return whether the listing is worth post-processing in a worker process"""
+    if (listing.service, listing.operation) in FOLLOW_UP_REQUEST_OPERATIONS:
+        return False
+    items = sum(len(value) for value in listing.response.values() if isinstance(value, list))
+    return items >= MIN_ITEMS_FOR_WORKER_PROCESS
+
+
+def acquire_listing(verbose, what, executor=None):
     """Given a service, region and operation execute the operation, serialize and save the result and
-    return a tuple of strings describing the result."""
-    service, region, operation, profile = what
+    return a tuple of strings describing the result. If an executor is given, large results are saved there."""
     start_time = time()
     try:
         if verbose > 1:
             print(what, 'starting request...')
-        listing = Listing.acquire(service, region, operation, profile)
-        duration = time() - start_time
-        if verbose > 1:
-            print(what, '...request successful')
-            print("timing [success]:", duration, what)
-        if listing.resource_total_count > 0:
-            with open('{}_{}_{}.json'.format(region, service, operation), 'w') as jsonfile:
-                json.dump(listing.to_json(), jsonfile, default=datetime.isoformat, indent=2)
-            return (RESULT_SOMETHING, service, region, operation, ', '.join(listing.resource_types))
-        else:
-            return (RESULT_NOTHING, service, region, operation, ', '.join(listing.resource_types))
+        listing = Listing.acquire(*what)
+        if executor is not None and use_worker_process(listing):
+            return executor.submit(save_listing, verbose, what, listing, time() - start_time).result()
+        return save_listing(verbose, what, listing, time() - start_time)
     except Exception as exc:  # pylint:disable=broad-except
-        duration = time() - start_time
-        if verbose > 1:
-            print(what, '...exception:', exc)
-            print("timing [failure]:", duration, what)
-        if verbose > 2:
-            print_exc()
-        result_type = RESULT_NO_ACCESS if 'AccessDeniedException' in str(exc) else RESULT_ERROR
-
-        ignored_err = RESULT_IGNORE_ERRORS.get(service, {}).get(operation)
-        if ignored_err is not None:
-            if not isinstance(ignored_err, list):
-                ignored_err = list(ignored_err)
-            for ignored_str_err in ignored_err:
-                if ignored_str_err in str(exc):
-                    result_type = RESULT_NOTHING
-
-        for not_available_string in NOT_AVAILABLE_STRINGS:
-            if not_available_string in str(exc):
+        return classify_exception(verbose, what, exc, time() - start_time)
+
+
+async def acquire_listing_async(semaphore, verbose, what, executor=None):
+    """Asynchronous variant of acquire_listing, limited in concurrency by the given semaphore.
+    Large results are saved in the given executor, all others in the event loop's default thread pool."""
+    start_time = time()
+    try:
+        async with semaphore:
+            if verbose > 1:
+                print(what, 'starting request...')
+            listing = await Listing.acquire_async(*what)
+        # Post-processing a listing is CPU-bound, and for kms ListKeys and ec2 DescribeInternetGateways it issues
+        # a further synchronous request, so keep it off the event loop
+        loop = asyncio.get_running_loop()
+        target = executor if use_worker_process(listing) else None
+        return await loop.run_in_executor(target, save_listing, verbose, what, listing, time() - start_time)
+    except Exception as exc:  # pylint:disable=broad-except
+        return classify_exception(verbose, what, exc, time() - start_time)
+
+
+def save_listing(verbose, what, listing, duration):
+    """Serialize and save an acquired listing and return a tuple of strings describing the result."""
+    service, region, operation, _ = what
+    if verbose > 1:
+        print(what, '...request successful')
+        print("timing [success]:", duration, what)
+    if listing.resource_total_count > 0:
+        with open('{}_{}_{}.json'.format(region, service, operation), 'w') as jsonfile:
+            json.dump(listing.to_json(), jsonfile, default=datetime.isoformat, indent=2)
+        return (RESULT_SOMETHING, service, region, operation, ', '.join(listing.resource_types))
+    else:
+        return (RESULT_NOTHING, service, region, operation, ', '.join(listing.resource_types))
+
+
+def classify_exception(verbose, what, exc, duration):
+    """Return a tuple of strings describing a failed query, ignoring known benign errors."""
+    service, region, operation, profile = what
+    if verbose > 1:
+        print(what, '...exception:', exc)
+        print("timing [failure]:", duration, what)
+    if verbose > 2:
+        print_exc()
+    result_type = RESULT_NO_ACCESS if 'AccessDeniedException' in str(exc) else RESULT_ERROR
+
+    ignored_err = RESULT_IGNORE_ERRORS.get(service, {}).get(operation)
+    if ignored_err is not None:
+        if not isinstance(ignored_err, list):
+            ignored_err = list(ignored_err)
+        for ignored_str_err in ignored_err:
+            if ignored_str_err in str(exc):
                 result_type = RESULT_NOTHING
 
-        return (result_type, service, region, operation, profile, repr(exc))
+    for not_available_string in NOT_AVAILABLE_STRINGS:
+        if not_available_string in str(exc):
+            result_type = RESULT_NOTHING
+
+    return (result_type, service, region, operation, profile, repr(exc))
 
 
 def do_list_files(filenames, verbose=0):
     """Print out a rudimentary summary of the Listing entities contained in the given files"""
     for listing_filename in filenames:
-        listing = Listing.from_json(json.load(open(listing_filename, 'rb')))
+        with open(listing_filename, 'rb') as listing_file:
+            data = orjson.loads(listing_file.read()) if CAN_USE_ORJSON else json.load(listing_file)
+        listing = Listing.from_json(data)
         resources = listing.resources
         truncated = False
         if 'truncated' in resources:
@@ -1,6 +1,6 @@
 from .introspection import (
-    get_endpoint_hosts, get_listing_operations, get_regions_for_service, get_service_regions, get_services,
-    introspect_regions_for_service
+    get_endpoint_hosts, get_listing_operations, get_regions_for_service, get_regions_for_services,
+    get_service_regions, get_services, introspect_regions_for_service
 )
 
 
@@ -35,6 +35,19 @@ def test_get_regions_for_service():
     assert set(get_regions_for_service('ec2', requested_regions=requested_regions)) == set(('us-east-2', 'eu-west-1'))
 
 
+def test_get_regions_for_services():
+    requested_regions = ('us-east-2', 'eu-west-1', 'nonexistent')
+    service_regions = get_regions_for_services(['ec2', 'iam'], requested_regions=requested_regions)
+    assert set(service_regions['ec2']) == set(('us-east-2', 'eu-west-1'))
+    assert service_regions['iam'] == [None]
+
+
+def test_get_regions_for_services_enabled_regions():
+    service_regions = get_regions_for_services(['ec2', 'iam'], enabled_regions={'eu-west-1'})
+    assert service_regions['ec2'] == ['eu-west-1']
+    assert service_regions['iam'] == [None]
+
+
 def test_introspect_regions_for_service():
     introspect_regions_for_service()
 
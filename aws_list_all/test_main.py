@@ -0,0 +1,59 @@
+import json
+import os
+import stat
+
+from .__main__ import restructure, write_results
+
+
+def test_write_results(tmp_path):
+    filename = str(tmp_path / 'aws_list_all.json')
+    results = {'results': {'eu-west-1': {'ec2': [{'operation': 'DescribeVpcs', 'result_types': ['Vpcs']}]}}}
+    umask = os.umask(0o022)
+    try:
+        write_results(filename, results)
+    finally:
+        os.umask(umask)
+    with open(filename) as f:
+        assert json.load(f) == results
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o644
+    assert os.listdir(str(tmp_path)) == ['aws_list_all.json']
+
+
+def test_write_results_keeps_mode(tmp_path):
+    filename = str(tmp_path / 'aws_list_all.json')
+    with open(filename, 'w') as f:
+        f.write('{}')
+    os.chmod(filename, 0o640)
+    write_results(filename, {'results': {}})
+    with open(filename) as f:
+        assert json.load(f) == {'results': {}}
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o640
+
+
+def test_restructure():
+    data = {
+        'results': [
+            ('results', 'ec2', 'eu-west-1', 'DescribeVpcs', 'Vpcs'),
+            ('results', 'ec2', 'eu-west-1', 'DescribeSubnets', 'Subnets'),
+            ('results', 'iam', None, 'ListUsers', 'Users, Marker'),
+        ],
+        'no_access': [
+            ('no_access', 'ec2', 'eu-west-1', 'DescribeHosts', None, "Exception('AccessDeniedException boom, more')"),
+        ],
+    }
+    assert restructure(data) == {
+        'results': {
+            'eu-west-1': {
+                'ec2': [
+                    {'operation': 'DescribeVpcs', 'result_types': ['Vpcs']},
+                    {'operation': 'DescribeSubnets', 'result_types': ['Subnets']},
+                ]
+            },
+            None: {'iam': [{'operation': 'ListUsers', 'result_types': ['Users', 'Marker']}]},
+        },
+        'no_access': {
+            'eu-west-1': {
+                'ec2': [{'operation': 'DescribeHosts', 'error': "Exception('AccessDeniedException boom, more')"}]
+            }
+        },
+    }
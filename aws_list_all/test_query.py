@@ -0,0 +1,62 @@
+import asyncio
+import sys
+from collections import defaultdict
+
+from . import query
+from .query import RESULT_NO_ACCESS, RESULT_SOMETHING, execute_queries_async
+
+# query imports the client module by its top-level name, so use that module object
+client = sys.modules[query.close_async_clients.__module__]
+
+
+class FakeAsyncClient(object):
+
+    def __init__(self):
+        self.closed = False
+
+    async def __aexit__(self, *args):
+        self.closed = True
+
+
+def test_execute_queries_async(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fake_clients = {}
+
+    async def get_async_client(service, region, profile):
+        key = (service, region, profile)
+        if key not in client._ASYNC_CLIENTS:
+            fake_clients[key] = FakeAsyncClient()
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(fake_clients[key])
+            client._ASYNC_CLIENTS[key] = future
+        return await client._ASYNC_CLIENTS[key]
+
+    async def acquire_async(service, region, operation, profile):
+        await get_async_client(service, region, profile)
+        if operation == 'DescribeHosts':
+            raise Exception('AccessDeniedException: not allowed')
+        vpcs = [{'VpcId': 'vpc-1', 'IsDefault': False}] if operation == 'DescribeVpcs' else []
+        response = {'ResponseMetadata': {'HTTPStatusCode': 200}, 'Vpcs': vpcs}
+        return query.Listing(service, region, operation, response, profile)
+
+    monkeypatch.setattr(query, 'get_async_client', get_async_client)
+    monkeypatch.setattr(query.Listing, 'acquire_async', staticmethod(acquire_async))
+
+    to_run = [
+        ['ec2', 'eu-west-1', 'DescribeVpcs', None],
+        ['ec2', 'eu-west-1', 'DescribeHosts', None],
+        ['ec2', 'us-east-2', 'DescribeVpcs2', None],
+    ]
+    results_by_type = defaultdict(list)
+    asyncio.run(execute_queries_async(to_run, results_by_type, verbose=0, parallel=2))
+
+    assert set(results_by_type) == {RESULT_SOMETHING, RESULT_NO_ACCESS}
+    assert results_by_type[RESULT_SOMETHING] == [(RESULT_SOMETHING, 'ec2', 'eu-west-1', 'DescribeVpcs', 'Vpcs')]
+    assert results_by_type[RESULT_NO_ACCESS] == [(
+        RESULT_NO_ACCESS, 'ec2', 'eu-west-1', 'DescribeHosts', None,
+        repr(Exception('AccessDeniedException: not allowed'))
+    )]
+    assert (tmp_path / 'eu-west-1_ec2_DescribeVpcs.json').exists()
+    assert set(fake_clients) == {('ec2', 'eu-west-1', None), ('ec2', 'us-east-2', None)}
+    assert all(fake_client.closed for fake_client in fake_clients.values())
+    assert client._ASYNC_CLIENTS == {}
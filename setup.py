@@ -30,6 +30,10 @@ setup(
     keywords='aws boto3 listings resources region services',
     packages=['aws_list_all'],
     install_requires=['boto3>=1.26.7', 'app_json_file_cache>=0.2.2'],
+    extras_require={
+        'async': ['aioboto3'],
+        'orjson': ['orjson'],
+    },
     entry_points={
         'console_scripts': [
             'aws_list_all=aws_list_all.__main__:main',